@@ -0,0 +1,131 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .common import *
+from .blackboard import Blackboard
+
+
+class AttachmentDownloader:
+
+    def __init__(self, attachment_config: dict, blackboard: Blackboard):
+        self.max_workers: int = attachment_config["max_workers"]
+        self.chunk_size: int = attachment_config["chunk_size"]
+        self.blackboard = blackboard
+        self.part_dir = os.path.join(ATTACHMENT_DIR, "partial")
+
+    def _discard(self, part_path: str):
+        """删除未下载完的文件及其校验信息，下次从头下载"""
+        for path in (part_path, part_path + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _fetch(self, url: str, name: str, can_restart: bool = True) -> str | None:
+        """流式下载一个附件，返回其相对于 record 目录的保存路径，下载失败时返回 None"""
+
+        # 未下载完的文件以链接的哈希命名，下次运行时可以从断点处继续下载
+        # 旁边的 .json 文件保存着开始下载时响应中的 ETag 或 Last-Modified，用于确认续传的是同一个文件
+        part_path = os.path.join(self.part_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+        validator = ""
+        if os.path.exists(part_path + ".json"):
+            validator = read_record_json(part_path + ".json").get("validator", "")
+        if len(validator) == 0:  # 没有校验信息就无法确认服务器上的文件没变，只能从头下载
+            self._discard(part_path)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        try:
+            with self.blackboard.get_attachment_response(url, offset, validator) as response:
+                content_type = response.headers.get("Content-Type", "")
+                content_range = response.headers.get("Content-Range", "")
+
+                if response.status_code not in (200, 206, 416):
+                    log(f"Attachment download failed ({response.status_code}): {name}")
+                    return None
+
+                # 416 时只有服务器上的文件大小恰好等于已下载的大小，才说明上次其实已经下载完了
+                # 206 时服务器必须从断点处续传，否则已下载的部分不能再用
+                if response.status_code == 416:
+                    is_range_valid = offset > 0 and content_range == f"bytes */{offset}"
+                elif response.status_code == 206:
+                    is_range_valid = content_range.startswith(f"bytes {offset}-")
+                else:
+                    is_range_valid = True
+
+                if not is_range_valid:
+                    self._discard(part_path)
+                    if not can_restart:
+                        log(f"Attachment download failed (invalid range response): {name}")
+                        return None
+                    # 已下载的部分被删除，重新请求时 offset 为 0，不再使用 Range，最多只会重试这一次
+                    return self._fetch(url, name, can_restart=False)
+                elif response.status_code == 416:
+                    pass
+                elif content_type.startswith("text/html"):
+                    # 登录页面或错误页面，不是附件
+                    log(f"Attachment download failed (got an HTML page): {name}")
+                    return None
+                else:
+                    # 服务器不支持 Range 或文件已经被替换时会返回 200 和完整文件，此时从头下载
+                    if response.status_code == 200:
+                        validator = response.headers.get("ETag") or response.headers.get("Last-Modified", "")
+                        write_record_json(part_path + ".json", {"validator": validator})
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    with open(part_path, mode) as file:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            file.write(chunk)
+        except Exception as e:
+            log(f"Attachment download exception: {e} ({name})")
+            return None
+
+        # 按块计算文件内容的哈希，内存占用与文件大小无关
+        sha256 = hashlib.sha256()
+        with open(part_path, "rb") as file:
+            while chunk := file.read(self.chunk_size):
+                sha256.update(chunk)
+
+        # 以内容哈希命名，不同课程、不同通知里的同一份文件只保存一次
+        file_name = sha256.hexdigest() + os.path.splitext(name)[1].lower()
+        file_path = os.path.join(ATTACHMENT_DIR, file_name)
+        if os.path.exists(file_path):
+            os.remove(part_path)
+        else:
+            os.replace(part_path, file_path)
+        self._discard(part_path)
+
+        log(f"Attachment downloaded: {name}")
+        return os.path.relpath(file_path, RECORD_DIR)
+
+    def download(self, records: list[dict]):
+        """并发下载 records 中的所有附件，并把保存路径写回各个附件条目的 path 字段"""
+
+        os.makedirs(self.part_dir, exist_ok=True)
+
+        # 附件链接到保存路径的索引，之前下载过的附件不必重复请求
+        if os.path.exists(ATTACHMENT_INDEX_PATH):
+            index = read_record_json(ATTACHMENT_INDEX_PATH)
+        else:
+            index = {}
+
+        pending = {}
+        for record in records:
+            for attachment in record.get("attachments", []):
+                url = attachment["url"]
+                stored_path = index.get(url)
+                if stored_path is None or not os.path.exists(os.path.join(RECORD_DIR, stored_path)):
+                    pending.setdefault(url, attachment["name"])
+
+        downloaded = 0
+        if len(pending) > 0:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._fetch, url, name): url for url, name in pending.items()}
+                for future in as_completed(futures):
+                    stored_path = future.result()
+                    if stored_path is not None:
+                        index[futures[future]] = stored_path
+                        downloaded += 1
+
+        # 下载失败的附件 path 为 None，已下载的部分会被保留，之后再遇到同一链接时从断点处继续
+        for record in records:
+            for attachment in record.get("attachments", []):
+                attachment["path"] = index.get(attachment["url"])
+
+        write_record_json(ATTACHMENT_INDEX_PATH, index)
+        log(f"Successfully downloaded {downloaded} attachments")
@@ -9,6 +9,7 @@ class Blackboard:
         self.username: str = iaaa_config["username"]
         self.password: str = iaaa_config["password"]
         self.session = requests.Session()
+        self.notice_data: dict | None = None
         self.session.headers.update(
             {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
@@ -83,7 +84,10 @@ class Blackboard:
         log("Blackboard connection success")
 
     def get_notice_data(self) -> dict:
-        """获取原始通知数据"""
+        """获取原始通知数据，一次运行中只请求一次"""
+
+        if self.notice_data is not None:
+            return self.notice_data
 
         # 先 get 一下，响应头分配一个 course.pku.edu.cn/webapps/streamViewer 下的 cookie JSESSIONID
         view_response = self.session.get(
@@ -115,8 +119,14 @@ class Blackboard:
             log(f"original response: \n{notice_response.text}")
             exit(1)
 
+        self.notice_data = notice_data
         return notice_data
 
+    def get_course_list(self) -> list[dict]:
+        """获取当前用户的课程列表（课程 id 与课程原名），与通知数据来自同一个请求"""
+
+        return self.get_notice_data().get("sv_extras", {}).get("sx_courses", [])
+
     def get_calendar_data(self, advance_hours: int) -> list[dict]:
         """获取原始日程表数据，用于检测从现在开始的若干小时内有没有要截止的作业或事件"""
 
@@ -160,3 +170,14 @@ class Blackboard:
         # 这个请求会重定向到对应作业的 /webapps/assignment/uploadAssignment 页面
 
         return assignment_response.text
+
+    def get_attachment_response(self, url: str, offset: int = 0, validator: str = "") -> requests.Response:
+        """以流式方式请求一个附件，offset 大于 0 时用 Range 请求头从断点处继续下载"""
+
+        # validator 是上次下载时响应中的 ETag 或 Last-Modified，如果文件在服务器上被替换了，If-Range
+        # 不成立，服务器会返回 200 和完整的新文件，而不是把新文件的后半段接在旧文件后面
+        if url.startswith("/"):
+            url = f"https://course.pku.edu.cn{url}"
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset > 0 else {}
+
+        return self.session.get(url, headers=headers, stream=True, timeout=60)
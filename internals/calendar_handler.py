@@ -1,48 +1,75 @@
 from .common import *
 from .blackboard import Blackboard
 from .notifier import Notifier
+from .attachment_downloader import AttachmentDownloader
+from .course_registry import CourseRegistry
+from .rules import RuleTable
 
 
 class CalendarHandler:
 
-    def __init__(self, calendar_config: dict, blackboard: Blackboard, notifier: Notifier):
+    def __init__(
+        self,
+        calendar_config: dict,
+        blackboard: Blackboard,
+        notifier: Notifier,
+        registry: CourseRegistry,
+        downloader: AttachmentDownloader | None = None,
+    ):
         self.advance_hours: int = calendar_config["advance_hours"]
         self.title_prefix: str = calendar_config["title_prefix"]
         self.display_time: bool = calendar_config["display_time"]
-        self.alias: dict = calendar_config["alias"]
+        self.rules: RuleTable = calendar_config["rules"]
         self.blackboard = blackboard
         self.notifier = notifier
+        self.registry = registry
+        self.downloader = downloader
+
+    def get_entry_fingerprint(self, entry: dict) -> str:
+        """由原始 calendar entry 中的标题、描述和截止时间计算指纹，不需要请求作业页面"""
+
+        return get_fingerprint(entry["title"], entry.get("description", ""), entry["endDate"])
 
     def filter_assignment_info(self, entry: dict) -> dict:
         """从一个原始 assignment entry 中提取有效信息，并整合为一条 record"""
 
         id = entry["id"]
         time = convert_timezone(entry["endDate"])
-        course = remove_suffix(entry["calendarName"])
+        course = self.registry.get_course_by_name(entry["calendarName"])
         title = entry["title"]
         description = entry.get("description", "")
-        should_notify = True  # 用户自定义的事件默认需要提醒
+        # 日程的标题和描述都是纯文本，可以直接查规则表，被屏蔽的作业不必请求作业页面
+        rule = self.rules.decide("assignment", course, "AS", title, description)
+        should_notify = rule.action == "notify"
+        attachments = []
 
         # 如果该日程是一个作业 DDL：若用户已提交过该作业则不用提醒，否则在 description 里加入作业要求并提醒
-        if course != "个人":
+        if course != "个人" and should_notify:
             assignment_html = self.blackboard.get_assignment_html_from_calendar(id)
             should_notify = not has_attempted(assignment_html)
             if should_notify:
                 instruction = parse_instruction(assignment_html)
                 if len(instruction) > 0:
                     description += f"\n{instruction}"
+                if self.downloader is not None:
+                    attachments = parse_attachments(assignment_html)
 
-        return {
+        record = {
             "id": id,
             "time": time,
             "course": course,
             "title": title,
             "description": description.strip(),  # 防止 description 以换行符开头
             "should_notify": should_notify,
+            "fingerprint": self.get_entry_fingerprint(entry),
         }
+        if len(attachments) > 0:
+            record["attachments"] = attachments
 
-    def notify_assignment(self, record: dict):
-        """由 assignment record 生成对应的消息标题与内容，并发送给用户"""
+        return record
+
+    def notify_assignment(self, record: dict, changed: bool = False, method: str = ""):
+        """由 assignment record 生成对应的消息标题与内容，并发送给用户；changed 表示这是一个被修改过的日程"""
 
         # 生成消息标题和标签
         if record["course"] == "个人":
@@ -52,19 +79,34 @@ class CalendarHandler:
                 course = "个人事件"
             subject = self.title_prefix + record["title"]
         else:
-            course = self.alias.get(record["course"].lower(), record["course"])
-            # 读取 ini 文件时键名会自动转为小写，如果课程名里有大写字母需要先化成小写再匹配
+            course = self.registry.get_alias(record["course"])
             sep = "：" if len(course) > 0 else ""
             subject = self.title_prefix + course + sep + record["title"]
+        if changed:
+            subject += "（已修改）"
 
         # 生成消息内容
         body = record["description"]
         if self.display_time:
             body += f"\n截止时间：{record['time']}"
 
-        self.notifier.notify_message(subject, body.strip(), tag=course)
+        self.notifier.notify_message(subject, body.strip(), tag=course, method=method)
         # 这里还要 strip 一下，防止 body 以换行符开头
 
+    def dispatch_assignment(self, record: dict, changed: bool = False):
+        """按匹配的规则发送一条 assignment record，处于该规则的免打扰时段时推迟到之后的运行中发送"""
+
+        rule = self.rules.decide("assignment", record["course"], "AS", record["title"], record["description"])
+        if rule.action == "drop":
+            record.pop("deferred", None)
+            log(f"Assignment ignored: {record['title']}（{record['course']}）")
+        elif rule.is_quiet():
+            record["deferred"] = "changed" if changed else "new"
+            log(f"Assignment deferred by quiet hours of rule '{rule.name}': {record['title']}（{record['course']}）")
+        else:
+            record.pop("deferred", None)
+            self.notify_assignment(record, changed, rule.method)
+
     def do(self):
         """主函数"""
 
@@ -82,13 +124,41 @@ class CalendarHandler:
             old_assignment_record = []
             is_init = True
 
-        old_assignment_ids = {record["id"] for record in old_assignment_record}
+        old_assignment_index = {record["id"]: index for index, record in enumerate(old_assignment_record)}
 
         # 3. 从 calendar_data 这些即将到期的日程中，过滤出未处理过的日程，并提取日程信息
+        #    对于已经处理过的日程，只比较指纹，指纹改变（修改了要求或截止时间）时才重新请求作业页面
         updated_assignment_record = []
+        changed_assignment_record = []
+        replaced_assignment_record = []  # 指纹变化而重新解析过的记录，包括 changed_assignment_record
+        is_record_modified = False
         for entry in calendar_data:
-            if entry["id"] not in old_assignment_ids:
+            index = old_assignment_index.get(entry["id"])
+            if index is None:
                 updated_assignment_record.append(self.filter_assignment_info(entry))
+                continue
+
+            old_record = old_assignment_record[index]
+            fingerprint = self.get_entry_fingerprint(entry)
+            if "fingerprint" not in old_record:
+                # 旧版本保存的记录没有指纹，补上即可，不当作修改
+                old_record["fingerprint"] = fingerprint
+                is_record_modified = True
+            elif old_record["fingerprint"] != fingerprint:
+                record = self.filter_assignment_info(entry)
+                old_assignment_record[index] = record
+                replaced_assignment_record.append(record)
+                is_record_modified = True
+                if "deferred" in old_record:
+                    # 之前因免打扰时段推迟、还没发出去的消息不能丢，沿用推迟状态，由补发推迟消息的步骤发送
+                    record["deferred"] = old_record["deferred"]
+                elif any(record[key] != old_record[key] for key in ("time", "title", "description")):
+                    changed_assignment_record.append(record)
+
+        #    如果启用了附件下载，把未提交作业的附件下载到本地，保存路径记录在对应 record 中
+        if self.downloader is not None:
+            # 所有重新解析过的记录都要经过下载器，已下载过的附件直接从索引中取回保存路径
+            self.downloader.download(updated_assignment_record + replaced_assignment_record)
 
         # 4. 若程序第一次运行到这里（record 文件还不存在），通知用户程序运行成功，顺便测试提醒消息
         #    能否正常发送（下一步中可能没有需要提醒的日程）
@@ -98,17 +168,30 @@ class CalendarHandler:
                 "之后就可以自动在作业、事件截止前提醒您了~",
             )
 
-        # 5. 对用户自定义的事件和未提交过的作业进行提醒
+        # 5. 按用户设置的规则，对用户自定义的事件和未提交过的作业进行提醒，并补发之前因免打扰时段而推迟的日程
+        for record in old_assignment_record:
+            if "deferred" in record:
+                if record["should_notify"]:
+                    self.dispatch_assignment(record, changed=record["deferred"] == "changed")
+                else:  # 重新解析后不再需要提醒（如作业已经提交）
+                    record.pop("deferred")
+                    log(f"Assignment ignored: {record['title']}（{record['course']}）")
+                is_record_modified = True
         for record in updated_assignment_record:
             if record["should_notify"]:
-                self.notify_assignment(record)
+                self.dispatch_assignment(record)
             else:
                 log(f"Assignment ignored: {record['title']}（{record['course']}）")
+        for record in changed_assignment_record:
+            if record["should_notify"]:
+                self.dispatch_assignment(record, changed=True)
+            else:
+                log(f"Changed assignment ignored: {record['title']}（{record['course']}）")
 
         # 6. 如果配置没有问题、之前的流程都成功完成（没有中途 exit），更新现在已处理过的日程记录
-        #   （未提醒的只有已经提交过的作业，也保存在记录中，以后不必再处理）
-        if is_init or len(updated_assignment_record) > 0:
+        #   （已经提交过或被规则屏蔽而没有提醒的日程也保存在记录中，以后不必再处理）
+        if is_init or is_record_modified or len(updated_assignment_record) > 0:
             new_assignment_record = old_assignment_record + updated_assignment_record
             write_record_json(ASSIGNMENT_RECORD_PATH, new_assignment_record)
         
-        log(f"Successfully processed {len(updated_assignment_record)} assignments")
+        log(f"Successfully processed {len(updated_assignment_record)} assignments, {len(changed_assignment_record)} changed")
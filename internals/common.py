@@ -1,6 +1,7 @@
 import os
 import re
 import json
+import hashlib
 from bs4 import BeautifulSoup
 from datetime import datetime
 import pytz
@@ -10,6 +11,9 @@ CONFIG_PATH = os.path.join(PROJECT_DIR, "config.ini")
 RECORD_DIR = os.path.join(os.path.dirname(PROJECT_DIR), "record")
 NOTICE_RECORD_PATH = os.path.join(RECORD_DIR, "notice_record.json")
 ASSIGNMENT_RECORD_PATH = os.path.join(RECORD_DIR, "assignment_record.json")
+ATTACHMENT_DIR = os.path.join(RECORD_DIR, "attachments")
+ATTACHMENT_INDEX_PATH = os.path.join(RECORD_DIR, "attachment_index.json")
+COURSE_REGISTRY_PATH = os.path.join(RECORD_DIR, "course_registry.json")
 
 
 def read_record_json(record_path: str) -> list[dict]:
@@ -19,12 +23,15 @@ def read_record_json(record_path: str) -> list[dict]:
     return record
 
 
-def write_record_json(record_path: str, record: list[dict]):
+def write_record_json(record_path: str, record: list[dict] | dict):
     """写入记录文件"""
     if not os.path.exists(RECORD_DIR):
         os.mkdir(RECORD_DIR)
-    with open(record_path, "w", encoding="utf-8") as file:
+    # 先写入临时文件再替换，其他进程（如 serve 模式）不会读到写了一半的文件
+    temp_path = record_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
         json.dump(record, file, ensure_ascii=False, indent=4)
+    os.replace(temp_path, record_path)
 
 
 def log(msg: str):
@@ -74,6 +81,18 @@ def remove_suffix(course_name: str) -> str:
     return re.sub(pattern, "", course_name)
 
 
+def get_suffix(course_name: str) -> str:
+    """提取课程名的学期后缀（不含括号），没有后缀时返回空串"""
+    match = re.search(r"\(([^()]*)\)$", course_name)
+    return "" if match is None else match.group(1)
+
+
+def get_fingerprint(*fields: str) -> str:
+    """计算若干字段规范化（合并连续空白）后的哈希，用于检测通知或日程是否被修改过"""
+    normalized = "\x1f".join(" ".join(field.split()) for field in fields)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
 def parse_title(title_html: str) -> str:
     """提取通知标题中的有效信息，去除 “课程公告” “打开/拒绝” 等标签"""
     soup = BeautifulSoup(title_html, "html.parser")
@@ -121,3 +140,28 @@ def parse_instruction(assignment_html: str) -> str:
                 text += f"\n附件{index + 1}：{tag.get_text().strip()}"
 
     return text
+
+
+def parse_attachments(html: str) -> list[dict]:
+    """提取上传作业页面或通知内容中的附件名称与链接"""
+    soup = BeautifulSoup(html, "html.parser")
+    title_tag = soup.find("title")
+    if title_tag is None:  # 通知内容，附件链接直接出现在正文中
+        container = soup
+    elif title_tag.get_text()[0] == "复":  # 已提交过该作业
+        container = soup.find("div", id="assignmentInfo")
+    else:  # 未提交过该作业
+        container = soup.find("li", id="instructions")
+
+    attachments = []
+    if container is not None:
+        seen_urls = set()
+        for tag in container.find_all("a", href=True):
+            url = tag["href"]
+            # 教学网上的课程文件都存放在 /bbcswebdav/ 下，其他链接（如外部网页）不是附件
+            if "/bbcswebdav/" not in url or url in seen_urls:
+                continue
+            seen_urls.add(url)
+            attachments.append({"name": tag.get_text().strip(), "url": url})
+
+    return attachments
@@ -1,9 +1,26 @@
 import os
 from configparser import ConfigParser
 from internals.common import log, CONFIG_PATH
+from internals.rules import compile_rules
 
 
-def get_config() -> tuple[dict, dict, dict, dict]:
+def read_config_file() -> ConfigParser:
+
+    if not os.path.exists(CONFIG_PATH):
+        log("File config.ini not found in the project directory")
+        exit(1)
+
+    config = ConfigParser()
+    config.read(CONFIG_PATH, encoding="utf-8")
+    for section in ["attachment", "server"]:
+        # 后来新增的配置节在较早的 config.ini 中可能不存在，按全部使用默认值处理
+        if not config.has_section(section):
+            config.add_section(section)
+
+    return config
+
+
+def get_config() -> tuple[dict, dict, dict, dict, dict, dict]:
 
     secret_names = ["iaaa_username", "iaaa_password", "email_address", "email_password", "sendkey"]
     secret_values = [os.getenv(name).strip() for name in secret_names]
@@ -11,12 +28,15 @@ def get_config() -> tuple[dict, dict, dict, dict]:
     given_secrets = [name for name, value in zip(secret_names, secret_values) if len(value) > 0]
     log(f"Secrets given: {given_secrets}")
 
-    if not os.path.exists(CONFIG_PATH):
-        log("File config.ini not found in the project directory")
-        exit(1)
+    config = read_config_file()
 
-    config = ConfigParser()
-    config.read(CONFIG_PATH, encoding="utf-8")
+    # 过滤与路由规则在这里一次性编译好，之后对每条通知或日程只需要查表
+    # 规则中只能选择已经配置好凭据的发送方式：bark, sc3, sct 共用一个 sendkey，只有 [notification]
+    # 节中设置的那一种可用；email 有单独的 secrets，设置了就可用
+    available_methods = {config["notification"].get("method", "")}
+    if len(secret_values[2]) > 0 and len(secret_values[3]) > 0:
+        available_methods.add("email")
+    rules = compile_rules(config, available_methods)
 
     iaaa_config = {
         "username": secret_values[0],
@@ -35,9 +55,7 @@ def get_config() -> tuple[dict, dict, dict, dict]:
         "notify_notice": config["notice"].getboolean("notify_notice", False),
         "title_prefix": config["notice"].get("title_prefix", "").replace("@", " "),
         "display_time": config["notice"].getboolean("display_time", True),
-        "general_allowed_events": config["notice"].get("general_allowed_events", "123"),
-        "specific_course_events": dict(config["notice:specific"]),
-        "alias": dict(config["alias"]),
+        "rules": rules,
     }
 
     assignment_config = {
@@ -45,7 +63,29 @@ def get_config() -> tuple[dict, dict, dict, dict]:
         "advance_hours": config["assignment"].getint("advance_hours", 0),
         "title_prefix": config["assignment"].get("title_prefix", "").replace("@", " "),
         "display_time": config["assignment"].getboolean("display_time", True),
+        "rules": rules,
+    }
+
+    attachment_config = {
+        "download_attachment": config["attachment"].getboolean("download_attachment", False),
+        "max_workers": config["attachment"].getint("max_workers", 4),
+        "chunk_size": config["attachment"].getint("chunk_size", 65536),
+    }
+
+    course_config = {
         "alias": dict(config["alias"]),
     }
 
-    return iaaa_config, notify_config, notice_config, assignment_config
+    return iaaa_config, notify_config, notice_config, assignment_config, attachment_config, course_config
+
+
+def get_server_config() -> dict:
+    # 服务模式只读取本地 record 文件，不需要登录教学网，也不需要任何 secrets
+
+    config = read_config_file()
+
+    return {
+        "host": config["server"].get("host", "127.0.0.1"),
+        "port": config["server"].getint("port", 8080),
+        "page_size": config["server"].getint("page_size", 20),
+    }
@@ -0,0 +1,90 @@
+from .common import *
+
+
+# course_registry.json 的格式为：
+# {
+#     "course_hash": 课程列表的指纹,
+#     "alias_hash": 别名设置的指纹,
+#     "courses": {课程 id: {"name": 课程原名, "course": 去除学期后缀的课程名, "term": 学期, "alias": 别名}}
+# }
+# 其他工具可以直接读取这个文件，或者用 CourseRegistry() 加载，不需要再请求教学网
+# 注册表只在启用通知模块时随通知数据一起刷新，只启用日程模块时不会额外请求课程列表
+
+
+class CourseRegistry:
+    """以课程 id 为键、跨运行保存的课程信息表，由通知和日程两个模块共用"""
+
+    def __init__(self, alias: dict | None = None):
+        self.alias: dict = alias or {}
+        self.course_hash: str = ""
+        self.courses: dict[str, dict] = {}
+        self.ids_by_name: dict[str, str] = {}  # 课程原名 -> 课程 id
+        self.aliases: dict[str, str] = {}  # 去除学期后缀的课程名 -> 别名
+
+        if os.path.exists(COURSE_REGISTRY_PATH):
+            registry = read_record_json(COURSE_REGISTRY_PATH)
+            self.course_hash = registry["course_hash"]
+            self.courses = registry["courses"]
+            self._build_index()
+            # 别名设置改了但课程列表没变时，只需重新解析别名
+            if alias is not None and registry["alias_hash"] != self._get_alias_hash():
+                self._resolve_aliases()
+                self._save()
+
+    def _get_alias_hash(self) -> str:
+        return get_fingerprint(json.dumps(sorted(self.alias.items()), ensure_ascii=False))
+
+    def _resolve_aliases(self):
+        for info in self.courses.values():
+            info["alias"] = self.alias.get(info["course"].lower(), info["course"])
+            # 读取 ini 文件时键名会自动转为小写，如果课程名里有大写字母需要先化成小写再匹配
+        self._build_index()
+
+    def _build_index(self):
+        self.ids_by_name = {info["name"]: id for id, info in self.courses.items()}
+        self.aliases = {info["course"]: info["alias"] for info in self.courses.values()}
+
+    def _save(self):
+        write_record_json(
+            COURSE_REGISTRY_PATH,
+            {
+                "course_hash": self.course_hash,
+                "alias_hash": self._get_alias_hash(),
+                "courses": self.courses,
+            },
+        )
+
+    def update(self, course_list: list[dict]):
+        """用 loadStream 返回的 sx_courses 刷新注册表，课程列表没有变化时什么也不做"""
+
+        course_hash = get_fingerprint(*sorted(f"{course['id']}\t{course['name']}" for course in course_list))
+        if course_hash == self.course_hash:
+            return
+
+        self.course_hash = course_hash
+        self.courses = {
+            course["id"]: {
+                "name": course["name"],
+                "course": remove_suffix(course["name"]),
+                "term": get_suffix(course["name"]),
+            }
+            for course in course_list
+        }
+        self._resolve_aliases()
+        self._save()
+        log(f"Course registry updated: {len(self.courses)} courses")
+
+    def get_course(self, course_id: str | None) -> str:
+        """由课程 id 得到去除学期后缀的课程名，未知的课程返回空串"""
+        info = self.courses.get(course_id)
+        return "" if info is None else info["course"]
+
+    def get_course_by_name(self, name: str) -> str:
+        """由课程原名（如日程的 calendarName）得到去除学期后缀的课程名"""
+        id = self.ids_by_name.get(name)
+        return remove_suffix(name) if id is None else self.courses[id]["course"]
+
+    def get_alias(self, course: str) -> str:
+        """由去除学期后缀的课程名得到别名，没有设置别名时返回课程名本身"""
+        alias = self.aliases.get(course)
+        return self.alias.get(course.lower(), course) if alias is None else alias
@@ -1,43 +1,91 @@
 from .common import *
 from .blackboard import Blackboard
 from .notifier import Notifier
+from .attachment_downloader import AttachmentDownloader
+from .course_registry import CourseRegistry
+from .rules import RuleTable
 
 
 class NoticeHandler:
 
-    def __init__(self, notice_config: dict, blackboard: Blackboard, notifier: Notifier):
+    def __init__(
+        self,
+        notice_config: dict,
+        blackboard: Blackboard,
+        notifier: Notifier,
+        registry: CourseRegistry,
+        downloader: AttachmentDownloader | None = None,
+    ):
         self.is_init: bool | None = None
         self.title_prefix: str = notice_config["title_prefix"]
         self.display_time: bool = notice_config["display_time"]
-        self.general_allowed_events: str = notice_config["general_allowed_events"]  # "123"
-        self.specific_course_events: dict = notice_config["specific_course_events"]  # "course": "123"
-        self.alias: dict = notice_config["alias"]
+        self.rules: RuleTable = notice_config["rules"]
         self.blackboard = blackboard
         self.notifier = notifier
+        self.registry = registry
+        self.downloader = downloader
 
-    def is_event_allowed(self, course: str, event: str) -> bool:
-        """检查一个 event 是否在该课程需要提醒的 events 范围中"""
+    def get_deadline_utc(self, entry: dict) -> str | None:
+        """取出 notice entry 中作业的截止时间（UTC），各级字段都可能缺失或为 null"""
 
-        allowed_events = self.specific_course_events.get(course.lower(), self.general_allowed_events)
-        # 读取 ini 文件时键名会自动转为小写，如果课程名里有大写字母需要先化成小写再匹配
+        details = (entry.get("itemSpecificData") or {}).get("notificationDetails") or {}
+        return details.get("dueDate")
 
-        if event.startswith("AS"):
-            return "1" in allowed_events
-        elif event.startswith("CO"):
-            return "2" in allowed_events
-        else:
-            return "3" in allowed_events
+    def get_text_fingerprint(self, entry: dict, title: str, content: str) -> str:
+        """由解析后的通知标题、内容和原始 entry 中的截止时间计算指纹"""
+
+        return get_fingerprint(title, content, self.get_deadline_utc(entry) or "")
+
+    def get_entry_fingerprint(self, entry: dict, course: str) -> str:
+        """由原始 notice entry 计算指纹，只需解析标题与内容，不需要请求详情页面"""
+
+        event = entry.get("extraAttribs", {}).get("event_type", "")
+        rule = self.rules.pre_decide("notice", course, event)
+        if rule is not None and rule.action == "drop":
+            # 被规则直接屏蔽的通知不解析 HTML，对原始 HTML 计算指纹
+            return get_fingerprint(
+                entry.get("se_context", ""), entry.get("se_details", ""), self.get_deadline_utc(entry) or ""
+            )
 
-    def filter_notice_info(self, entry: dict, course_dict: dict) -> dict:
+        title = parse_title(entry.get("se_context", ""))
+        content = parse_content(entry.get("se_details", ""))
+        return self.get_text_fingerprint(entry, title, content)
+
+    def filter_notice_info(self, entry: dict) -> dict:
         """从一个原始 notice entry 中提取有效信息，并整合为一条 record"""
 
         id = entry["se_id"]
         time = convert_to_time(entry["se_timestamp"])
-        course = course_dict.get(entry.get("se_courseId"), "")
+        course = self.registry.get_course(entry.get("se_courseId"))
+        event = entry.get("extraAttribs", {}).get("event_type", "")
+
+        # 先只凭课程和事件类型查规则表，被屏蔽的通知不必解析 HTML
+        # 这样的记录没有标题和内容，用 dropped 标记出来，serve 模式不会提供它们
+        rule = self.rules.pre_decide("notice", course, event)
+        if rule is not None and rule.action == "drop":
+            return {
+                "id": id,
+                "time": time,
+                "course": course,
+                "title": "",
+                "content": "",
+                "event": event,
+                "should_notify": False,
+                "dropped": True,
+                "fingerprint": self.get_entry_fingerprint(entry, course),
+            }
+
         title = parse_title(entry.get("se_context", ""))
         content = parse_content(entry.get("se_details", ""))
-        event = entry.get("extraAttribs", {}).get("event_type", "")
-        should_notify = self.is_event_allowed(course, event)
+        fingerprint = self.get_text_fingerprint(entry, title, content)  # 在 content 加入作业要求等信息之前计算
+        if rule is None:  # 还有依赖标题或内容的规则
+            rule = self.rules.decide("notice", course, event, title, content)
+        should_notify = rule.action == "notify"
+        attachments = []
+
+        # 如果启用了附件下载而且这条 record 会被发送给用户，收集通知内容中的附件
+        if self.downloader is not None and should_notify and not self.is_init:
+            attachments += parse_attachments(entry.get("se_details", ""))
 
         # 如果事件类型是作业可用而且这条 record 会被发送给用户，在 content 里加入作业要求和截止时间
         if event == "AS:AS_AVAIL" and "se_itemUri" in entry and should_notify and not self.is_init:
@@ -45,11 +93,13 @@ class NoticeHandler:
             instruction = parse_instruction(assignment_html)
             if len(instruction) > 0:
                 content += f"\n{instruction}"
-            deadline_utc = entry["itemSpecificData"]["notificationDetails"].get("dueDate")
+            if self.downloader is not None:
+                attachments += parse_attachments(assignment_html)
+            deadline_utc = self.get_deadline_utc(entry)
             if deadline_utc is not None:
                 content += f"\n截止时间：{convert_timezone(deadline_utc)}"
 
-        return {
+        record = {
             "id": id,
             "time": time,
             "course": course,
@@ -57,34 +107,51 @@ class NoticeHandler:
             "content": content.strip(),  # 防止 content 以换行符开头
             "event": event,
             "should_notify": should_notify,
+            "fingerprint": fingerprint,
         }
+        if len(attachments) > 0:
+            record["attachments"] = attachments
 
-    def notify_notice(self, record: dict):
-        """由 notice record 生成对应的消息标题与内容，并发送给用户"""
+        return record
+
+    def notify_notice(self, record: dict, changed: bool = False, method: str = ""):
+        """由 notice record 生成对应的消息标题与内容，并发送给用户；changed 表示这是一条被修改过的通知"""
 
         # 生成消息标题和标签
-        course = self.alias.get(record["course"].lower(), record["course"])
-        # 读取 ini 文件时键名会自动转为小写，如果课程名里有大写字母需要先化成小写再匹配
+        course = self.registry.get_alias(record["course"])
         sep = "：" if len(course) > 0 else ""
         subject = self.title_prefix + course + sep + record["title"]
+        if changed:
+            subject += "（已修改）"
 
         # 生成消息内容
         body = record["content"]
         if self.display_time:
             body += f"\n发布时间：{record['time']}"
 
-        self.notifier.notify_message(subject, body.strip(), tag=course)
+        self.notifier.notify_message(subject, body.strip(), tag=course, method=method)
         # 这里还要 strip 一下，防止 body 以换行符开头
 
+    def dispatch_notice(self, record: dict, changed: bool = False):
+        """按匹配的规则发送一条 notice record，处于该规则的免打扰时段时推迟到之后的运行中发送"""
+
+        rule = self.rules.decide("notice", record["course"], record["event"], record["title"], record["content"])
+        if rule.action == "drop":
+            record.pop("deferred", None)
+            log(f"Notice ignored: {record['title']}（{record['course']}）")
+        elif rule.is_quiet():
+            record["deferred"] = "changed" if changed else "new"
+            log(f"Notice deferred by quiet hours of rule '{rule.name}': {record['title']}（{record['course']}）")
+        else:
+            record.pop("deferred", None)
+            self.notify_notice(record, changed, rule.method)
+
     def do(self):
         """主函数"""
 
-        # 1. 从教学网获取通知原始信息，并生成课程 id 到课程名的映射字典
+        # 1. 从教学网获取通知原始信息（课程注册表已经在 main.py 中由同一份数据更新过）
         notice_data = self.blackboard.get_notice_data()
 
-        course_list = notice_data.get("sv_extras", {}).get("sx_courses", [])
-        course_dict = {course["id"]: remove_suffix(course["name"]) for course in course_list}
-
         # 2. 根据 record 文件是否存在来判断是否已经初始化，读取已在本地记录中的通知
         if os.path.exists(NOTICE_RECORD_PATH):
             old_notice_record = read_record_json(NOTICE_RECORD_PATH)
@@ -93,13 +160,45 @@ class NoticeHandler:
             old_notice_record = []
             self.is_init = True
 
-        old_notice_ids = {record["id"] for record in old_notice_record}
+        old_notice_index = {record["id"]: index for index, record in enumerate(old_notice_record)}
 
         # 3. 从所有通知中过滤出新的（本地没有记录的）通知，并提取通知信息
+        #    对于已经记录过的通知，只比较指纹，指纹改变（老师修改过）时才重新解析、请求详情页面
         updated_notice_record = []
+        changed_notice_record = []
+        replaced_notice_record = []  # 指纹变化而重新解析过的记录，包括 changed_notice_record
+        is_record_modified = False
         for entry in notice_data.get("sv_streamEntries", []):
-            if entry["se_id"] not in old_notice_ids:
-                updated_notice_record.append(self.filter_notice_info(entry, course_dict))
+            index = old_notice_index.get(entry["se_id"])
+            if index is None:
+                updated_notice_record.append(self.filter_notice_info(entry))
+                continue
+
+            old_record = old_notice_record[index]
+            fingerprint = self.get_entry_fingerprint(entry, self.registry.get_course(entry.get("se_courseId")))
+            if "fingerprint" not in old_record:
+                # 旧版本保存的记录没有指纹，补上即可，不当作修改
+                old_record["fingerprint"] = fingerprint
+                is_record_modified = True
+            elif old_record["fingerprint"] != fingerprint:
+                record = self.filter_notice_info(entry)
+                old_notice_record[index] = record
+                replaced_notice_record.append(record)
+                is_record_modified = True
+                if "deferred" in old_record:
+                    # 之前因免打扰时段推迟、还没发出去的消息不能丢，沿用推迟状态，由补发推迟消息的步骤发送
+                    record["deferred"] = old_record["deferred"]
+                # 规则设置改变导致记录在“被直接屏蔽”和“正常解析”之间切换时，指纹也会变化，但不是老师修改的
+                elif record.get("dropped", False) != old_record.get("dropped", False):
+                    pass
+                # 指纹变化但解析后的标题与内容没变（比如只改了格式），不必再提醒
+                elif record["title"] != old_record["title"] or record["content"] != old_record["content"]:
+                    changed_notice_record.append(record)
+
+        #    如果启用了附件下载，把新通知和被修改的通知中的附件下载到本地，保存路径记录在对应 record 中
+        if self.downloader is not None:
+            # 所有重新解析过的记录都要经过下载器，已下载过的附件直接从索引中取回保存路径
+            self.downloader.download(updated_notice_record + replaced_notice_record)
 
         # 4. 若程序第一次运行到这里（record 文件还不存在），则需要初始化，将本次检测到的通知作为
         #    初始数据保存在记录中；同时通知用户程序运行成功，顺便测试提醒消息能否正常发送
@@ -109,18 +208,31 @@ class NoticeHandler:
                 f"初始化已完成，从教学网同步了 {len(updated_notice_record)} 条已有通知。之后就可以自动检测新的通知并提醒您了~",
             )
 
-        # 否则根据用户对课程与 event 的屏蔽设置，选择性地对新通知进行提醒
+        # 否则根据用户设置的规则，选择性地对新通知进行提醒，并补发之前因免打扰时段而推迟的通知
         else:
+            for record in old_notice_record:
+                if "deferred" in record:
+                    if record["should_notify"]:
+                        self.dispatch_notice(record, changed=record["deferred"] == "changed")
+                    else:  # 重新解析后不再需要提醒（如作业已经提交）
+                        record.pop("deferred")
+                        log(f"Notice ignored: {record['title']}（{record['course']}）")
+                    is_record_modified = True
             for record in updated_notice_record:
                 if record["should_notify"]:
-                    self.notify_notice(record)
+                    self.dispatch_notice(record)
+                else:
+                    log(f"Notice ignored: {record['title'] or record['id']}（{record['course']}）")
+            for record in changed_notice_record:
+                if record["should_notify"]:
+                    self.dispatch_notice(record, changed=True)
                 else:
-                    log(f"Notice ignored: {record['title']}（{record['course']}）")
+                    log(f"Changed notice ignored: {record['title'] or record['id']}（{record['course']}）")
 
         # 5. 如果配置没有问题、之前的流程都成功完成（没有中途 exit），更新现在已处理过的通知记录
         #   （由于用户屏蔽而没有提醒的通知也保存在记录中，以后不必再处理）
-        if self.is_init or len(updated_notice_record) > 0:
+        if self.is_init or is_record_modified or len(updated_notice_record) > 0:
             new_notice_record = old_notice_record + updated_notice_record
             write_record_json(NOTICE_RECORD_PATH, new_notice_record)
         
-        log(f"Successfully processed {len(updated_notice_record)} notices")
+        log(f"Successfully processed {len(updated_notice_record)} notices, {len(changed_notice_record)} changed")
@@ -16,17 +16,18 @@ class Notifier:
         self.sendkey: str = notify_config["sendkey"]
         self.status: int = 0  # 0 为发送成功, 1 为发送失败，2 为超过发送次数限制
 
-    def notify_message(self, subject: str, body: str, tag: str = ""):
-        """用 method 指定的方式向用户发送提醒消息"""
+    def notify_message(self, subject: str, body: str, tag: str = "", method: str = ""):
+        """用 method 指定的方式向用户发送提醒消息，未指定时使用 config.ini 中设置的方式"""
 
+        method = method or self.method
         if self.status != 2:  # self.status == 0
-            if self.method == "email":
+            if method == "email":
                 self._email_notify(subject, body)
-            elif self.method == "bark":
+            elif method == "bark":
                 self._bark_notify(subject, body, tag)
-            elif self.method == "sct":
+            elif method == "sct":
                 self._sct_notify(subject, body)
-            elif self.method == "sc3":
+            elif method == "sc3":
                 self._sc3_notify(subject, body, tag)
             else:
                 log("The notification method must be 'email', 'bark', 'sc3' or 'sct'")
@@ -34,9 +35,9 @@ class Notifier:
                 self.status = 1
 
         if self.status == 0:
-            log(f"Successfully sended a notification message by {self.method}: {subject}")
+            log(f"Successfully sended a notification message by {method}: {subject}")
         elif self.status == 1:
-            log(f"Failed to send the notification message by {self.method}: {subject}")
+            log(f"Failed to send the notification message by {method}: {subject}")
             exit(1)
         else:
             log(f"SCT limit reached, ignore notify failure and go on: {subject}")
@@ -0,0 +1,185 @@
+import re
+from configparser import ConfigParser
+from datetime import datetime
+import pytz
+from .common import log
+
+
+def get_event_class(event: str) -> str:
+    """把通知的 event_type 归为 1（与作业相关）、2（与内容相关）、3（其他）三类"""
+    if event.startswith("AS"):
+        return "1"
+    elif event.startswith("CO"):
+        return "2"
+    else:
+        return "3"
+
+
+class Rule:
+
+    def __init__(
+        self,
+        name: str,
+        scope: str = "all",
+        course: str | None = None,
+        title: str | None = None,
+        keywords: list[str] | None = None,
+        events: str = "123",
+        action: str = "notify",
+        method: str = "",
+        quiet_hours: tuple[int, int] | None = None,
+    ):
+        self.name = name
+        self.scope = scope  # notice, assignment 或 all
+        self.course = None if course is None else re.compile(course, re.IGNORECASE)
+        self.title = None if title is None else re.compile(title, re.IGNORECASE)
+        self.keywords = [keyword.lower() for keyword in keywords or []]
+        self.events = events
+        self.action = action  # notify 或 drop
+        self.method = method  # 为空时使用 [notification] 节中的 method
+        self.quiet_hours = quiet_hours  # (开始分钟, 结束分钟)，可以跨过午夜
+
+        # 只依赖课程和事件类型的规则不需要通知标题与内容，在解析 HTML 之前就能做出决定
+        self.needs_text = self.title is not None or len(self.keywords) > 0
+
+    def match_key(self, scope: str, course: str, event_class: str) -> bool:
+        """检查规则的作用范围、课程和事件类型条件"""
+        return (
+            self.scope in ("all", scope)
+            and event_class in self.events
+            and (self.course is None or self.course.search(course) is not None)
+        )
+
+    def match_text(self, title: str, content: str) -> bool:
+        """检查规则的标题和关键词条件"""
+        if self.title is not None and self.title.search(title) is None:
+            return False
+        if len(self.keywords) > 0:
+            text = f"{title}\n{content}".lower()
+            return any(keyword in text for keyword in self.keywords)
+        return True
+
+    def is_quiet(self) -> bool:
+        """检查当前时间是否在该规则的免打扰时段内"""
+        if self.quiet_hours is None:
+            return False
+        dt = datetime.now(pytz.timezone("Asia/Shanghai"))
+        minute = dt.hour * 60 + dt.minute
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+
+DROP_RULE = Rule("default", action="drop")
+
+
+class RuleTable:
+    """按顺序匹配的规则表，对每组 (作用范围, 课程, 事件类型) 预先算出决定并缓存"""
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = rules
+        self.decisions: dict[tuple[str, str, str], tuple[list[Rule], Rule]] = {}
+
+    def _lookup(self, scope: str, course: str, event_class: str) -> tuple[list[Rule], Rule]:
+        """返回 (需要标题与内容才能判断的候选规则, 候选规则都不匹配时使用的规则)"""
+
+        key = (scope, course, event_class)
+        decision = self.decisions.get(key)
+        if decision is None:
+            candidates = []
+            fallback = DROP_RULE
+            for rule in self.rules:
+                if not rule.match_key(scope, course, event_class):
+                    continue
+                if rule.needs_text:
+                    candidates.append(rule)
+                else:
+                    fallback = rule  # 之后的规则都不可能被用到了
+                    break
+            # 如果所有候选规则的决定都和兜底规则相同，也就不需要看标题与内容了
+            if all(rule.action == fallback.action and rule.method == fallback.method for rule in candidates):
+                if all(rule.quiet_hours == fallback.quiet_hours for rule in candidates):
+                    candidates = []
+            decision = (candidates, fallback)
+            self.decisions[key] = decision
+
+        return decision
+
+    def pre_decide(self, scope: str, course: str, event: str) -> Rule | None:
+        """只根据课程和事件类型做出决定，返回 None 表示还需要标题与内容才能决定"""
+
+        candidates, fallback = self._lookup(scope, course, get_event_class(event))
+        return fallback if len(candidates) == 0 else None
+
+    def decide(self, scope: str, course: str, event: str, title: str, content: str) -> Rule:
+        """根据课程、事件类型、标题与内容决定匹配的规则"""
+
+        candidates, fallback = self._lookup(scope, course, get_event_class(event))
+        for rule in candidates:
+            if rule.match_text(title, content):
+                return rule
+        return fallback
+
+
+def parse_quiet_hours(quiet_hours: str) -> tuple[int, int]:
+    """把 "23:00-07:30" 这样的时段转换为 (开始分钟, 结束分钟)"""
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})", quiet_hours.replace(" ", ""))
+    if match is None:
+        raise ValueError(f"invalid quiet_hours '{quiet_hours}', expected a format like 23:00-07:30")
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    if start_hour >= 24 or end_hour >= 24 or start_minute >= 60 or end_minute >= 60:
+        raise ValueError(f"invalid quiet_hours '{quiet_hours}', hours must be 0-23 and minutes must be 0-59")
+    return start_hour * 60 + start_minute, end_hour * 60 + end_minute
+
+
+def compile_rules(config: ConfigParser, available_methods: set[str]) -> RuleTable:
+    """把 config.ini 中的 [rule:xx] 节和原有的通知类型设置编译为一张规则表，available_methods 为可用的发送方式"""
+
+    rules = []
+    for section in config.sections():
+        if not section.startswith("rule:"):
+            continue
+        # 正则表达式中可能有 %，读取时关闭插值
+        options = {key: config.get(section, key, raw=True).strip() for key in config.options(section)}
+        try:
+            rule = Rule(
+                section[len("rule:") :],
+                scope=options.get("scope", "all"),
+                course=options.get("course") or None,
+                title=options.get("title") or None,
+                keywords=[keyword.strip() for keyword in options.get("keywords", "").split(",") if keyword.strip()],
+                events=options.get("events", "123"),
+                action=options.get("action", "notify"),
+                method=options.get("method", ""),
+                quiet_hours=parse_quiet_hours(options["quiet_hours"]) if options.get("quiet_hours") else None,
+            )
+        except (re.error, ValueError) as e:
+            log(f"Invalid rule [{section}]: {e}")
+            log("Please check config.ini")
+            exit(1)
+
+        if rule.scope not in ("notice", "assignment", "all"):
+            log(f"Invalid rule [{section}]: 'scope' must be 'notice', 'assignment' or 'all'")
+            exit(1)
+        if rule.action not in ("notify", "drop"):
+            log(f"Invalid rule [{section}]: 'action' must be 'notify' or 'drop'")
+            exit(1)
+        if len(rule.events) == 0 or not set(rule.events) <= set("123"):
+            log(f"Invalid rule [{section}]: 'events' must consist of the digits 1, 2 and 3")
+            exit(1)
+        if rule.method != "" and rule.method not in available_methods:
+            # bark, sc3, sct 共用同一个 sendkey，只能使用 [notification] 节中设置的那一种
+            log(f"Invalid rule [{section}]: 'method' must be one of {sorted(available_methods)}")
+            log("A rule can only use 'email' (with email secrets given) or the method in [notification]")
+            exit(1)
+        rules.append(rule)
+
+    # 原有的 [notice:specific] 和 general_allowed_events 设置作为优先级最低的规则
+    for course, events in config["notice:specific"].items():
+        rules.append(Rule(f"notice:specific:{course}", scope="notice", course=f"^{re.escape(course)}$", events=events))
+        rules.append(Rule(f"notice:specific:{course}:drop", scope="notice", course=f"^{re.escape(course)}$", action="drop"))
+    rules.append(Rule("notice:general", scope="notice", events=config["notice"].get("general_allowed_events", "123")))
+    rules.append(Rule("assignment:default", scope="assignment"))
+
+    return RuleTable(rules)
@@ -0,0 +1,215 @@
+import hashlib
+from bisect import bisect_left
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .common import *
+
+
+class RecordUnavailableError(Exception):
+    """record 文件还从未被成功读取过"""
+
+
+class RecordSnapshot:
+    """某一版本 record 文件的内容、由它建立的各个视图，以及由它生成的响应缓存"""
+
+    def __init__(self, version: tuple, notices: list[dict], deadlines: list[dict], registry: dict):
+        self.version = version
+        # 被规则直接屏蔽的通知没有解析标题与内容（dropped 为 true），不提供给客户端
+        notices = [record for record in notices if not record.get("dropped", False)]
+        self.notices = sorted(notices, key=lambda record: record["time"], reverse=True)  # 按发布时间从新到旧
+        self.deadlines = sorted(deadlines, key=lambda record: record["time"])  # 按截止时间从早到晚
+        self.deadline_times = [record["time"] for record in self.deadlines]
+        self.courses: dict[str, dict] = {}  # 课程名 -> {"alias": ..., "term": ..., "notices": [...], "deadlines": [...]}
+        self.responses: dict[tuple, tuple[bytes, str]] = {}  # (路径, 参数, 未截止 DDL 的起点) -> (响应体, ETag)
+
+        # 课程的别名与学期来自 watcher 维护的课程注册表
+        course_info = {info["course"]: info for info in registry.values()}
+        for key, records in (("notices", self.notices), ("deadlines", self.deadlines)):
+            for record in records:
+                if len(record["course"]) > 0:
+                    info = course_info.get(record["course"], {})
+                    view = self.courses.setdefault(
+                        record["course"],
+                        {
+                            "alias": info.get("alias", record["course"]),
+                            "term": info.get("term", ""),
+                            "notices": [],
+                            "deadlines": [],
+                        },
+                    )
+                    view[key].append(record)
+
+
+class RecordStore:
+    """只读地访问 watcher 保存的 record 文件，文件改变时才重新读取，并缓存已经生成的响应"""
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self.lock = Lock()
+        self.snapshot: RecordSnapshot | None = None
+
+    def _refresh(self) -> RecordSnapshot:
+        """若 record 文件的修改时间或大小发生变化，重新读取并建立新的快照；读取失败时继续使用旧的快照"""
+
+        version = tuple(
+            (os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+            for path in (NOTICE_RECORD_PATH, ASSIGNMENT_RECORD_PATH, COURSE_REGISTRY_PATH)
+        )
+        snapshot = self.snapshot
+        if snapshot is not None and version == snapshot.version:
+            return snapshot
+
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is not None and version == snapshot.version:  # 其他线程已经完成了重新读取
+                return snapshot
+
+            try:
+                snapshot = RecordSnapshot(
+                    version,
+                    read_record_json(NOTICE_RECORD_PATH) if version[0] is not None else [],
+                    read_record_json(ASSIGNMENT_RECORD_PATH) if version[1] is not None else [],
+                    read_record_json(COURSE_REGISTRY_PATH)["courses"] if version[2] is not None else {},
+                )
+            except (OSError, ValueError, KeyError) as e:
+                log(f"Failed to read record files: {e}")
+                if self.snapshot is None:
+                    raise RecordUnavailableError(str(e))
+                return self.snapshot  # 下一个请求会再次尝试读取
+
+            self.snapshot = snapshot
+            return snapshot
+
+    def _paginate(self, records: list[dict], query: dict) -> dict:
+        """按 page（从 1 开始）和 per_page 参数截取一页数据"""
+
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", [str(self.page_size)])[0])
+        if page < 1 or per_page < 1:
+            raise ValueError("page and per_page must be positive integers")
+
+        start = (page - 1) * per_page
+        return {
+            "total": len(records),
+            "page": page,
+            "per_page": per_page,
+            "items": records[start : start + per_page],
+        }
+
+    def _build(self, snapshot: RecordSnapshot, path: str, query: dict, now: str) -> dict | None:
+        """由快照生成一个路径对应的响应数据，路径不存在时返回 None"""
+
+        def upcoming(deadlines: list[dict]) -> list[dict]:
+            return deadlines[bisect_left(deadlines, now, key=lambda record: record["time"]) :]
+
+        if path == "/deadlines":
+            return self._paginate(upcoming(snapshot.deadlines), query)
+        if path == "/notices":
+            return self._paginate(snapshot.notices, query)
+        if path == "/courses":
+            return {
+                "items": [
+                    {
+                        "course": course,
+                        "alias": view["alias"],
+                        "term": view["term"],
+                        "notices": len(view["notices"]),
+                        "deadlines": len(upcoming(view["deadlines"])),
+                    }
+                    for course, view in sorted(snapshot.courses.items())
+                ]
+            }
+        if path.startswith("/courses/"):
+            course = unquote(path[len("/courses/") :])
+            view = snapshot.courses.get(course)
+            if view is None:
+                return None
+            return {
+                "course": course,
+                "alias": view["alias"],
+                "term": view["term"],
+                "notices": self._paginate(view["notices"], query),
+                "deadlines": upcoming(view["deadlines"]),
+            }
+        return None
+
+    def get(self, url: str) -> tuple[bytes, str] | None:
+        """返回 url 对应的 (响应体, ETag)，路径不存在时返回 None"""
+
+        # 整个请求只使用同一个快照，响应也缓存在这个快照里，不会把旧数据生成的响应混进新快照的缓存
+        snapshot = self._refresh()
+
+        split = urlsplit(url)
+        query = parse_qs(split.query)
+        # 已经截止的 DDL 不再出现在响应中，因此当前时间越过某个 DDL 后对应的缓存也要失效
+        now = convert_to_time(get_current_timestamp())
+        upcoming_start = bisect_left(snapshot.deadline_times, now)
+        key = (split.path, tuple(sorted((name, tuple(values)) for name, values in query.items())), upcoming_start)
+
+        response = snapshot.responses.get(key)
+        if response is None:
+            data = self._build(snapshot, split.path, query, now)
+            if data is None:
+                return None
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            response = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+            if len(snapshot.responses) >= 1024:  # 防止各种不同的查询参数让缓存无限增长
+                snapshot.responses.clear()
+            snapshot.responses[key] = response
+
+        return response
+
+
+class RecordRequestHandler(BaseHTTPRequestHandler):
+
+    store: RecordStore
+
+    def _send(self, status: int, body: bytes = b"", etag: str | None = None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        try:
+            response = self.store.get(self.path)
+        except RecordUnavailableError as e:  # 还没有可用的 record 数据
+            self._send(503, json.dumps({"error": f"records unavailable: {e}"}).encode("utf-8"))
+            return
+        except ValueError as e:  # page 或 per_page 不是正整数
+            self._send(400, json.dumps({"error": str(e)}).encode("utf-8"))
+            return
+
+        if response is None:
+            self._send(404, json.dumps({"error": "not found"}).encode("utf-8"))
+            return
+
+        body, etag = response
+        if etag in self.headers.get("If-None-Match", ""):
+            self._send(304, etag=etag)
+        else:
+            self._send(200, body, etag)
+
+    def log_message(self, format: str, *args):
+        pass  # 每个请求都输出日志太多了，只保留 log() 的启动和错误信息
+
+
+def run_server(server_config: dict):
+    """启动只读的 HTTP/JSON 服务，从本地 record 文件提供通知与 DDL 数据，不会访问教学网"""
+
+    RecordRequestHandler.store = RecordStore(server_config["page_size"])
+    server = ThreadingHTTPServer((server_config["host"], server_config["port"]), RecordRequestHandler)
+    log(f"Serving records on http://{server_config['host']}:{server_config['port']}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        log("Server stopped")
@@ -1,23 +1,39 @@
+import sys
 from internals.common import log
-from internals.config import get_config
+from internals.config import get_config, get_server_config
 from internals.blackboard import Blackboard
 from internals.notifier import Notifier
+from internals.attachment_downloader import AttachmentDownloader
+from internals.course_registry import CourseRegistry
 from internals.notice_handler import NoticeHandler
 from internals.calendar_handler import CalendarHandler
+from internals.server import run_server
 
 if __name__ == "__main__":
 
+    # python main.py serve：只读地对外提供本地 record 数据，不访问教学网
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        run_server(get_server_config())
+        exit(0)
+
     log("Program started")
 
-    iaaa_config, notify_config, notice_config, assignment_config = get_config()
+    iaaa_config, notify_config, notice_config, assignment_config, attachment_config, course_config = get_config()
 
     blackboard = Blackboard(iaaa_config)
     blackboard.login()
     notifier = Notifier(notify_config)
+    registry = CourseRegistry(course_config["alias"])
+    if notice_config["notify_notice"]:
+        # 课程列表与通知数据来自同一个请求，通知模块之后会直接使用这次请求的结果，不会多请求一次
+        # 只启用日程模块时不刷新，避免额外请求教学网；日程模块会使用已保存的注册表，查不到的课程
+        # 退回到 remove_suffix 和 [alias] 的设置
+        registry.update(blackboard.get_course_list())
+    downloader = AttachmentDownloader(attachment_config, blackboard) if attachment_config["download_attachment"] else None
 
     if notice_config["notify_notice"]:
-        NoticeHandler(notice_config, blackboard, notifier).do()
+        NoticeHandler(notice_config, blackboard, notifier, registry, downloader).do()
     if assignment_config["notify_assignment"]:
-        CalendarHandler(assignment_config, blackboard, notifier).do()
+        CalendarHandler(assignment_config, blackboard, notifier, registry, downloader).do()
 
     log("Program completed")